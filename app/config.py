@@ -11,14 +11,64 @@ UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 TMP_DIR.mkdir(parents=True, exist_ok=True)
 
 REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", "16"))
 REDIS_TTL_SECONDS = 1800  # 30 minutes
+TTL_REFRESH_SECONDS = 5  # how often a running job re-arms its keys' TTL
+# cached JPEG frames are pushed in groups: up to this many frames, or after this long
+REDIS_PUSH_BATCH = int(os.environ.get("REDIS_PUSH_BATCH", "8"))
+REDIS_PUSH_INTERVAL_S = float(os.environ.get("REDIS_PUSH_INTERVAL_S", "0.2"))
+# default for caching JPEG frames in Redis (download fallback); uploads may opt out per job
+PERSIST_FRAMES = os.environ.get("PERSIST_FRAMES", "1") == "1"
+# Same-host consumers: JPEGs also go into a shared-memory ring of this many slots
+# (0 disables) and Redis only carries a job:<id>:idx stream of (frame, slot, len)
+FRAME_RING_SLOTS = int(os.environ.get("FRAME_RING_SLOTS", "0"))
+FRAME_RING_SLOT_BYTES = int(os.environ.get("FRAME_RING_SLOT_BYTES", str(512 * 1024)))
 
 MAX_UPLOAD_SIZE = 200 * 1024 * 1024  # 200 MB
 ALLOWED_EXT = {".mp4", ".mov", ".avi", ".mkv"}
 
+# Frame batching for inference: frames per YOLO forward pass, and the longest
+# a partial batch may wait before it is flushed anyway (seconds)
+INFER_BATCH_SIZE = int(os.environ.get("INFER_BATCH_SIZE", "8"))
+INFER_BATCH_TIMEOUT_S = float(os.environ.get("INFER_BATCH_TIMEOUT_S", "0.25"))
+# capacity (frames) of each bounded queue between a job's capture/inference/publish stages
+FRAME_QUEUE_SIZE = int(os.environ.get("FRAME_QUEUE_SIZE", str(2 * INFER_BATCH_SIZE)))
+
+# Frames whose 32x32 grayscale thumbnail differs from the last inferred frame by less
+# than this mean absolute pixel value reuse its boxes instead of running YOLO (0 disables)
+FRAME_DIFF_THRESHOLD = float(os.environ.get("FRAME_DIFF_THRESHOLD", "2.0"))
+
+# A WebSocket send that takes longer than this drops that viewer
+WS_SEND_TIMEOUT_S = float(os.environ.get("WS_SEND_TIMEOUT_S", "5"))
+# Frames sent to live viewers are downscaled to at most this width (0 keeps full resolution);
+# the mp4, the Redis frame cache and the frame ring stay at source resolution
+LIVE_FRAME_MAX_WIDTH = int(os.environ.get("LIVE_FRAME_MAX_WIDTH", "960"))
+# Live view transport: "jpeg" (one image per frame) or "h264" (fragmented MP4 over the
+# WebSocket, played through MSE; needs PyAV, falls back to jpeg without it)
+LIVE_STREAM_FORMAT = os.environ.get("LIVE_STREAM_FORMAT", "jpeg").lower()
+
+# YOLO precision: "fp16" runs half precision on CUDA (falls back to fp32 on CPU).
+# YOLO_TORCHSCRIPT=1 exports the weights to TorchScript once and reuses the cached file.
+YOLO_PRECISION = os.environ.get("YOLO_PRECISION", "fp16").lower()
+YOLO_TORCHSCRIPT = os.environ.get("YOLO_TORCHSCRIPT", "0") == "1"
+
+# WARMUP_MODELS=1 loads every MODEL_MAP model and runs a dummy predict at startup
+WARMUP_MODELS = os.environ.get("WARMUP_MODELS", "0") == "1"
+
+# Video decoder: "auto" uses NVDEC through ffmpegcv when it is installed and CUDA is
+# available, "nvdec" asks for it explicitly, "opencv" always uses cv2.VideoCapture
+VIDEO_DECODER = os.environ.get("VIDEO_DECODER", "auto").lower()
+
 # ffmpeg binary
 FFMPEG_BIN = os.environ.get("FFMPEG_BIN", "ffmpeg")
 
+# H.264 encoder: "libx264" (default), a hardware encoder such as "h264_nvenc",
+# "h264_vaapi", "h264_videotoolbox", or "auto" to pick the best one ffmpeg offers.
+# Unavailable encoders fall back to libx264. FFMPEG_PRESET overrides the per-encoder default.
+FFMPEG_VCODEC = os.environ.get("FFMPEG_VCODEC", "libx264")
+FFMPEG_PRESET = os.environ.get("FFMPEG_PRESET", "")
+FFMPEG_VAAPI_DEVICE = os.environ.get("FFMPEG_VAAPI_DEVICE", "/dev/dri/renderD128")
+
 # Model weight paths (example). Update with real paths/weights.
 MODEL_MAP = {
     "yolov8n": "yolov8n.pt",   # if ultralytics is installed it resolves, else put path to .pt
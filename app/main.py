@@ -1,9 +1,12 @@
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.routes import upload, download, ws, models
-from app.config import STATIC_DIR
+from app.config import STATIC_DIR, MODEL_MAP, WARMUP_MODELS
+from app.utils.video import select_video_codec
 
 app = FastAPI(title="FastAPI Video Inference")
 
@@ -16,6 +19,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.on_event("startup")
+async def probe_ffmpeg_encoder():
+    # probe (and trial-encode with) ffmpeg's encoders once up front instead of inside the first job/download
+    codec = await asyncio.to_thread(select_video_codec)
+    print(f"🎬 ffmpeg video encoder: {codec}")
+
+
+def _warmup_models():
+    import numpy as np
+    import torch
+    from app.tasks import get_model_runner
+
+    # let cuDNN autotune its kernels during warmup rather than on the first real frame
+    torch.backends.cudnn.benchmark = True
+    dummy = np.zeros((640, 640, 3), dtype=np.uint8)
+    for name in MODEL_MAP:
+        try:
+            get_model_runner(name).predict(dummy)
+            print(f"🔥 Warmed up model: {name}")
+        except Exception as e:
+            print(f"⚠️ Warmup failed for {name}: {e}")
+
+
+@app.on_event("startup")
+async def warmup_models():
+    # load weights, the CUDA context and Ultralytics' lazy imports before traffic arrives
+    if WARMUP_MODELS:
+        await asyncio.to_thread(_warmup_models)
+
+
 # include routes
 app.include_router(upload.router, prefix="")
 app.include_router(download.router, prefix="")
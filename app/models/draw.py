@@ -0,0 +1,102 @@
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+# ✅ numba is optional: without it the same kernels run as plain numpy slicing
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        def wrap(fn):
+            return fn
+        return wrap
+
+
+@lru_cache(maxsize=8)
+def _stroke(thickness: int):
+    """
+    OpenCV's geometry for a thick line, measured once from cv2 itself: the half-width of
+    an axis-aligned stroke and the (dy, dx) offsets of its round end cap.
+    cv2.rectangle(..., thickness) is exactly four such lines between the corners.
+    """
+    size = 4 * thickness + 9
+    mid = size // 2
+    canvas = np.zeros((size, size), np.uint8)
+    cv2.line(canvas, (2, mid), (size - 3, mid), 1, thickness)
+    half = int(np.flatnonzero(canvas[:, mid]).max()) - mid
+    canvas[:] = 0
+    cv2.line(canvas, (mid, mid), (mid, mid), 1, thickness)
+    cap = (np.argwhere(canvas) - mid).astype(np.int32)
+    return half, cap
+
+
+def draw_boxes(out, xyxy, colors, thickness):
+    """
+    Stamp rectangle outlines into a HxWx3 uint8 image in place, pixel-identical to
+    cv2.rectangle(out, (x1, y1), (x2, y2), color, thickness).
+    xyxy: (N, 4) int32 box corners (may lie outside the image; off-image parts are skipped).
+    colors: (N, 3) uint8 BGR colors.
+    """
+    half, cap = _stroke(thickness)
+    _draw_boxes(out, xyxy, colors, half, cap)
+
+
+@njit(cache=True, inline="always")
+def _fill(out, ya, yb, xa, xb, c, v):
+    """out[ya:yb, xa:xb, c] = v with the ranges clamped to the image."""
+    h = out.shape[0]
+    w = out.shape[1]
+    ya = min(max(ya, 0), h)
+    yb = min(max(yb, 0), h)
+    xa = min(max(xa, 0), w)
+    xb = min(max(xb, 0), w)
+    if ya < yb and xa < xb:
+        out[ya:yb, xa:xb, c] = v
+
+
+@njit(cache=True, parallel=False, boundscheck=False)
+def _draw_boxes(out, xyxy, colors, half, cap):
+    h = out.shape[0]
+    w = out.shape[1]
+    for i in range(xyxy.shape[0]):
+        x1 = min(xyxy[i, 0], xyxy[i, 2])
+        x2 = max(xyxy[i, 0], xyxy[i, 2])
+        y1 = min(xyxy[i, 1], xyxy[i, 3])
+        y2 = max(xyxy[i, 1], xyxy[i, 3])
+        for c in range(3):
+            v = colors[i, c]
+            # straight strokes between the corners
+            _fill(out, y1 - half, y1 + half + 1, x1, x2 + 1, c, v)   # top
+            _fill(out, y2 - half, y2 + half + 1, x1, x2 + 1, c, v)   # bottom
+            _fill(out, y1, y2 + 1, x1 - half, x1 + half + 1, c, v)   # left
+            _fill(out, y1, y2 + 1, x2 - half, x2 + half + 1, c, v)   # right
+            # round caps at the four corners
+            for k in range(cap.shape[0]):
+                for py in (y1, y2):
+                    y = py + cap[k, 0]
+                    if y < 0 or y >= h:
+                        continue
+                    for px in (x1, x2):
+                        x = px + cap[k, 1]
+                        if 0 <= x < w:
+                            out[y, x, c] = v
+
+
+@njit(cache=True, parallel=False, boundscheck=False)
+def fill_rects(out, rects, colors):
+    """
+    Fill solid rectangles (label backgrounds) into a HxWx3 uint8 image in place.
+    rects: (N, 4) int32 as x1, y1, x2, y2 (inclusive), colors: (N, 3) uint8 BGR.
+    """
+    h = out.shape[0]
+    w = out.shape[1]
+    for i in range(rects.shape[0]):
+        xa = max(rects[i, 0], 0)
+        ya = max(rects[i, 1], 0)
+        xb = min(rects[i, 2] + 1, w)
+        yb = min(rects[i, 3] + 1, h)
+        if xa >= xb or ya >= yb:
+            continue
+        for c in range(3):
+            out[ya:yb, xa:xb, c] = colors[i, c]
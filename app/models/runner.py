@@ -1,9 +1,16 @@
 import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+
 import cv2
 import torch
 import numpy as np
 from ultralytics import YOLO
 
+from app.config import YOLO_PRECISION, YOLO_TORCHSCRIPT, FRAME_DIFF_THRESHOLD
+from app.models.draw import draw_boxes, fill_rects
+
 # ✅ Safe-load fix for PyTorch 2.6+
 try:
     from ultralytics.nn.tasks import DetectionModel
@@ -11,11 +18,43 @@ try:
 except Exception as e:
     print(f"⚠️ Safe global registration failed: {e}")
 
+# 🔠 Label style
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 1.3
+FONT_THICKNESS = 3
+BOX_THICKNESS = 3
+
+# ✅ Default fallback palette (built once; indexed by class id)
+DEFAULT_PALETTE = np.array([
+    (255, 99, 132),   # pink/red
+    (54, 162, 235),   # blue
+    (255, 206, 86),   # yellow
+    (75, 192, 192),   # teal
+    (153, 102, 255),  # purple
+    (255, 159, 64),   # orange
+    (46, 204, 113),   # green
+    (52, 73, 94),     # dark gray
+], dtype=np.uint8)
+
+
+@lru_cache(maxsize=1024)
+def _text_size(label: str):
+    """cv2.getTextSize for the label style, memoized (labels repeat across frames)."""
+    return cv2.getTextSize(label, FONT, FONT_SCALE, FONT_THICKNESS)
+
+
+def _thumbnail(frame):
+    """32x32 grayscale thumbnail (int16) used by the frame difference detector."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.int16)
+
 
 class ModelRunner:
     """
     YOLO model runner supporting:
     - local .pt model loading with safe torch load
+    - CUDA placement with FP16 / cached TorchScript export
+    - batched inference, skipping near-duplicate frames
     - dynamic color map injection from frontend or Redis
     """
 
@@ -38,6 +77,22 @@ class ModelRunner:
             print(f"🔹 Loading built-in YOLO model: {model_spec}")
             self.model = YOLO(model_spec)
 
+        # ⚡ Device + precision
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.half = YOLO_PRECISION == "fp16" and self.device == "cuda"
+        if YOLO_PRECISION == "fp16" and not self.half:
+            print("⚠️ FP16 requested but CUDA is not available — falling back to FP32 on CPU.")
+
+        if YOLO_TORCHSCRIPT:
+            self._load_torchscript()
+        else:
+            self.model.to(self.device)
+            self.model.fuse()
+        print(f"⚡ Inference on {self.device} ({'fp16' if self.half else 'fp32'})")
+
+        # 🔒 Runners are shared between jobs; one forward pass at a time per model
+        self._lock = threading.Lock()
+
         # ✅ Apply color map from argument (if provided)
         self.class_colors = class_colors or {}
         if self.class_colors:
@@ -60,68 +115,147 @@ class ModelRunner:
             return (color.get("b", 0), color.get("g", 0), color.get("r", 0))
         return (0, 255, 0)  # fallback green
 
+    def _load_torchscript(self):
+        """Swap the model for a TorchScript export, exporting once and caching it next to the weights."""
+        ckpt_path = getattr(self.model, "ckpt_path", None)
+        if not ckpt_path:
+            print("⚠️ TorchScript requested but model has no weights file — keeping eager model.")
+            self.model.to(self.device)
+            return
+
+        suffix = ".fp16.torchscript" if self.half else ".torchscript"
+        ts_path = Path(ckpt_path).with_suffix(suffix)
+        try:
+            if not ts_path.exists():
+                print(f"🔧 Exporting TorchScript: {ts_path}")
+                exported = self.model.export(format="torchscript", half=self.half, imgsz=640, device=self.device)
+                Path(exported).replace(ts_path)
+            self.model = YOLO(str(ts_path), task="detect")
+        except Exception as e:
+            print(f"⚠️ TorchScript export/load failed, keeping eager model: {e}")
+            self.model.to(self.device)
+
     # ============================================================
     # 🔮 Inference
     # ============================================================
     def predict(self, frame):
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        preds = self.model.predict(source=rgb, imgsz=640, conf=0.25, verbose=False)
-        out = frame.copy()
+        return self.predict_batch([frame])[0]
+
+    def predict_batch(self, frames, stream: dict = None, class_colors: dict = None):
+        """
+        Run one batched forward pass over a list of BGR frames.
+        Boxes are drawn in place, so each returned result_frame is the input frame itself.
+        unchanged=True means nothing was drawn; callers must not mutate that buffer.
+
+        stream: optional per-video state dict (one per job, reused across calls). When given,
+        frames nearly identical to the last inferred frame skip YOLO and reuse its boxes
+        (result has skipped=True).
+
+        class_colors: optional {label: color} overrides for this call only; defaults to the
+        runner's own class_colors. Runners are shared between jobs, so per-job colors go here.
+        """
+        if not frames:
+            return []
+
+        # 🔍 Difference detector: decide which frames actually need a forward pass
+        ref = None
+        if stream is not None and FRAME_DIFF_THRESHOLD > 0:
+            run = []
+            ref = stream.get("thumb")
+            for frame in frames:
+                thumb = _thumbnail(frame)
+                needs_run = ref is None or np.abs(thumb - ref).mean() >= FRAME_DIFF_THRESHOLD
+                if needs_run:
+                    ref = thumb
+                run.append(needs_run)
+        else:
+            run = [True] * len(frames)
+
+        to_run = [frame for frame, needs_run in zip(frames, run) if needs_run]
+        preds = iter(self._infer(to_run) if to_run else [])
+        # only now move the reference: if _infer raised, thumb and dets stay a matching pair
+        if ref is not None:
+            stream["thumb"] = ref
+
+        if class_colors is None:
+            class_colors = self.class_colors
+        results = []
+        dets = stream.get("dets") if stream is not None else None
+        for frame, needs_run in zip(frames, run):
+            if needs_run:
+                dets = self._detections(next(preds, None))
+            result = self._draw_detections(frame, dets, class_colors)
+            result["skipped"] = not needs_run
+            results.append(result)
+        if stream is not None:
+            stream["dets"] = dets
+        return results
+
+    def _infer(self, frames):
+        # Ultralytics expects numpy frames in OpenCV's BGR order and converts them itself
+        with self._lock:
+            return self.model.predict(
+                source=list(frames), imgsz=640, conf=0.25, half=self.half, device=self.device, verbose=False
+            )
+
+    def _detections(self, res):
+        """Boxes of one result as host arrays (xyxy int32, conf, cls int32), or None if empty."""
+        boxes = getattr(res, "boxes", None)
+        if boxes is None or len(boxes) == 0:
+            return None
+        try:
+            # 📦 One device→host transfer per tensor instead of three per box
+            return (
+                boxes.xyxy.detach().cpu().numpy().astype(np.int32),
+                boxes.conf.detach().cpu().numpy(),
+                boxes.cls.detach().cpu().numpy().astype(np.int32),
+            )
+        except Exception as e:
+            print(f"⚠️ Error reading boxes: {e}")
+            return None
+
+    def _draw_detections(self, frame, dets, class_colors):
+        if dets is None:
+            # nothing to draw: hand the decoded frame straight back
+            return {"result_frame": frame, "unchanged": True}
+
+        out = frame
 
         # ✅ Load class name map
         names = getattr(self.model, "names", {})
 
-        # ✅ Default fallback palette
-        default_palette = [
-            (255, 99, 132),   # pink/red
-            (54, 162, 235),   # blue
-            (255, 206, 86),   # yellow
-            (75, 192, 192),   # teal
-            (153, 102, 255),  # purple
-            (255, 159, 64),   # orange
-            (46, 204, 113),   # green
-            (52, 73, 94),     # dark gray
-        ]
-
-        if len(preds) > 0:
-            res = preds[0]
-            boxes = getattr(res, "boxes", None)
-
-            if boxes is not None:
-                for b in boxes:
-                    try:
-                        xyxy = b.xyxy[0].cpu().numpy()
-                        conf = float(b.conf[0].cpu().numpy()) if hasattr(b, "conf") else 0.0
-                        cls = int(b.cls[0].cpu().numpy()) if hasattr(b, "cls") else -1
-                        label_name = names.get(cls, f"class_{cls}")
-                        label = f"{label_name} {conf:.2f}"
-                        x1, y1, x2, y2 = map(int, xyxy.tolist())
-
-                        # 🎨 Use selected color if available, otherwise fallback
-                        if label_name in self.class_colors:
-                            color = self._ensure_bgr_tuple(self.class_colors[label_name])
-                        else:
-                            color = default_palette[cls % len(default_palette)]
-
-                        # 🟩 Draw thicker bounding box
-                        cv2.rectangle(out, (x1, y1), (x2, y2), color, 3)
-
-                        # 🔠 Larger, more readable label text
-                        font_scale = 1.3
-                        font_thickness = 3
-                        font = cv2.FONT_HERSHEY_SIMPLEX
-                        (text_w, text_h), baseline = cv2.getTextSize(label, font, font_scale, font_thickness)
-
-                        pad_y, pad_x = 10, 12
-                        top_left = (x1, max(0, y1 - text_h - pad_y - baseline))
-                        bottom_right = (x1 + text_w + pad_x, y1)
-
-                        cv2.rectangle(out, top_left, bottom_right, color, -1)
-                        cv2.putText(out, label, (x1 + 5, y1 - 10),
-                                    font, font_scale, (255, 255, 255), font_thickness, cv2.LINE_AA)
-
-                    except Exception as e:
-                        print(f"⚠️ Error drawing box: {e}")
-                        continue
-
-        return {"result_frame": out}
+        try:
+            xyxy, confs, clses = dets
+
+            n = len(xyxy)
+            colors = DEFAULT_PALETTE[clses % len(DEFAULT_PALETTE)]
+            label_rects = np.empty((n, 4), dtype=np.int32)
+            labels = []
+            pad_y, pad_x = 10, 12
+            for i in range(n):
+                cls = int(clses[i])
+                label_name = names.get(cls, f"class_{cls}")
+                label = f"{label_name} {float(confs[i]):.2f}"
+                labels.append(label)
+
+                # 🎨 Use selected color if available, otherwise keep the palette color
+                if label_name in class_colors:
+                    colors[i] = self._ensure_bgr_tuple(class_colors[label_name])
+
+                (text_w, text_h), baseline = _text_size(label)
+                x1, y1 = int(xyxy[i, 0]), int(xyxy[i, 1])
+                label_rects[i] = (x1, max(0, y1 - text_h - pad_y - baseline), x1 + text_w + pad_x, y1)
+
+            # 🟩 Box outlines + label backgrounds in two native passes
+            draw_boxes(out, xyxy, colors, BOX_THICKNESS)
+            fill_rects(out, label_rects, colors)
+
+            # 🔠 Text stays on OpenCV's rasterizer
+            for i in range(n):
+                cv2.putText(out, labels[i], (int(xyxy[i, 0]) + 5, int(xyxy[i, 1]) - 10),
+                            FONT, FONT_SCALE, (255, 255, 255), FONT_THICKNESS, cv2.LINE_AA)
+
+        except Exception as e:
+            print(f"⚠️ Error drawing boxes: {e}")
+
+        return {"result_frame": out, "unchanged": False}
@@ -1,13 +1,29 @@
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pathlib import Path
-import io, os, tempfile, shutil, asyncio, subprocess
+import io, os, tempfile, shutil, asyncio
 
 from app.utils.redis_client import get_redis
-from app.config import TMP_DIR, REDIS_TTL_SECONDS, FFMPEG_BIN
+from app.config import TMP_DIR, REDIS_TTL_SECONDS
+from app.utils.video import stitch_from_redis, NoFramesCached
 
 router = APIRouter()
 
+
+async def _clear_job_cache(redis, frames_key: str, meta_key: str):
+    """Drop the job's cached frames + meta in a single round trip."""
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.delete(frames_key)
+        pipe.delete(meta_key)
+        await pipe.execute()
+
+
+def _remove_file(path):
+    """Delete a served video; the job's cache is already cleared, so it can't be requested again."""
+    Path(path).unlink(missing_ok=True)
+
+
 @router.get("/download/{job_id}")
 async def download_job(job_id: str):
     redis = get_redis()
@@ -19,48 +35,37 @@ async def download_job(job_id: str):
     if not meta:
         raise HTTPException(status_code=404, detail="Job not found or expired")
 
-    # get all frames
-    frames = await redis.lrange(frames_key, 0, -1)
-    if not frames:
-        raise HTTPException(status_code=404, detail="No frames cached for job (expired or failed)")
+    # frames and the live encoder's mp4 are still being written
+    if meta.get(b"status") == b"running":
+        raise HTTPException(status_code=409, detail="Job is still running; try again when it is done")
 
-    # write frames to temp folder
-    out_dir = TMP_DIR / f"dl_{job_id}"
-    out_dir.mkdir(parents=True, exist_ok=True)
-    frame_files = []
-    for i, b in enumerate(frames):
-        p = out_dir / f"frame_{i:06d}.jpg"
-        with open(p, "wb") as f:
-            f.write(b)
-        frame_files.append(p)
+    # the worker encodes the mp4 while the job runs; serve it directly when it finished cleanly
+    video_path = meta.get(b"video_path", b"").decode()
+    if video_path and Path(video_path).exists():
+        await _clear_job_cache(redis, frames_key, meta_key)
+        return FileResponse(video_path, filename=f"{job_id}.mp4", media_type="video/mp4",
+                            background=BackgroundTask(_remove_file, video_path))
 
+    # fallback: re-encode the cached JPEG frames (encoder unavailable or job interrupted)
     # determine fps from meta if present, else default 25
     fps = float(meta.get(b"fps", b"25").decode() ) if b"fps" in meta else 25.0
 
-    out_video = out_dir / f"{job_id}.mp4"
-
-    # call ffmpeg to stitch frames
-    cmd = [
-        FFMPEG_BIN,
-        "-y",
-        "-framerate", str(fps),
-        "-i", str(out_dir / "frame_%06d.jpg"),
-        "-c:v", "libx264",
-        "-pix_fmt", "yuv420p",
-        str(out_video)
-    ]
-    # run blocking in thread
-    def run_ffmpeg():
-        subprocess.run(cmd, check=True)
+    # separate from the worker's own TMP_DIR/<job_id>.mp4
+    out_video = TMP_DIR / f"dl_{job_id}.mp4"
 
+    # frames are paged out of Redis straight into ffmpeg's stdin; no per-frame temp files
     try:
-        await asyncio.to_thread(run_ffmpeg)
-    except subprocess.CalledProcessError as e:
+        await stitch_from_redis(job_id, out_video, fps)
+    except NoFramesCached:
+        if meta.get(b"persist_frames") == b"0":
+            raise HTTPException(status_code=404, detail="Job ran without frame caching and no video was produced")
+        raise HTTPException(status_code=404, detail="No frames cached for job (expired or failed)")
+    except (RuntimeError, OSError) as e:
         raise HTTPException(status_code=500, detail=f"ffmpeg failed: {e}")
 
     # stream file
     # Optionally clear the redis cache for the job
-    await redis.delete(frames_key)
-    await redis.delete(meta_key)
+    await _clear_job_cache(redis, frames_key, meta_key)
 
-    return FileResponse(str(out_video), filename=f"{job_id}.mp4", media_type="video/mp4")
+    return FileResponse(str(out_video), filename=f"{job_id}.mp4", media_type="video/mp4",
+                        background=BackgroundTask(_remove_file, out_video))
@@ -1,32 +1,55 @@
 # app/routes/models.py
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from ultralytics import YOLO
-import torch
+import asyncio
+import shutil
 import tempfile
 import os
 
 router = APIRouter()
 
+
+def _write_tmp(src) -> str:
+    """Copy an uploaded file object to a temp .pt file (blocking; run in a thread)."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pt") as tmp:
+        shutil.copyfileobj(src, tmp, 8 * 1024 * 1024)
+        return tmp.name
+
+
+def _read_class_names(path: str) -> list:
+    """
+    Read class names from a YOLO .pt checkpoint.
+    Tries the pickled checkpoint dict first (no model build / device move),
+    then falls back to a full YOLO load.
+    """
+    # imported lazily: keeps torch/ultralytics out of server startup
+    import torch
+    try:
+        ckpt = torch.load(path, map_location="cpu", weights_only=False)
+        names = None
+        if isinstance(ckpt, dict):
+            names = getattr(ckpt.get("model"), "names", None) or ckpt.get("names")
+        if names:
+            return list(names.values()) if isinstance(names, dict) else list(names)
+    except Exception as e:
+        print(f"⚠️ Direct checkpoint read failed, loading full model: {e}")
+
+    from ultralytics import YOLO
+    names = getattr(YOLO(path), "names", {})
+    return list(names.values()) if isinstance(names, dict) else list(names)
+
 @router.post("/analyze_model")
 async def analyze_model(model_file: UploadFile = File(...)):
     """Extract class names from uploaded YOLO model (.pt)."""
     if not model_file.filename.endswith(".pt"):
         raise HTTPException(status_code=400, detail="Only .pt files are supported")
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pt") as tmp:
-        contents = await model_file.read()
-        tmp.write(contents)
-        tmp_path = tmp.name
+    # stream the spooled upload to disk off the event loop (no full read into memory)
+    tmp_path = await asyncio.to_thread(_write_tmp, model_file.file)
 
     try:
-        model = YOLO(tmp_path)
-        names = getattr(model, "names", {})
-        if isinstance(names, dict):
-            class_names = list(names.values())
-        else:
-            class_names = names
-        os.remove(tmp_path)
+        class_names = await asyncio.to_thread(_read_class_names, tmp_path)
+        await asyncio.to_thread(os.remove, tmp_path)
         return {"class_names": class_names}
     except Exception as e:
-        os.remove(tmp_path)
+        await asyncio.to_thread(os.remove, tmp_path)
         raise HTTPException(status_code=500, detail=f"Model load failed: {str(e)}")
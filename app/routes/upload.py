@@ -3,58 +3,93 @@ from fastapi.responses import JSONResponse
 import uuid
 from pathlib import Path
 import asyncio
-import json
+import hashlib
+import orjson
 import os
+import shutil
+from typing import TYPE_CHECKING
 
 from app.utils.redis_client import get_redis
-from app.config import MAX_UPLOAD_SIZE, ALLOWED_EXT
-from app.tasks import run_inference_job
-from app.models.runner import ModelRunner
+from app.config import MAX_UPLOAD_SIZE, ALLOWED_EXT, PERSIST_FRAMES
+from app.tasks import run_inference_job, get_model_runner, normalize_model_key
+
+if TYPE_CHECKING:
+    from app.models.runner import ModelRunner
 
 router = APIRouter()
 
-# 🧠 Store reference to currently active model
-active_model_runner: ModelRunner | None = None
+# 🧠 Store reference to currently active model (ModelRunner itself is imported lazily with torch)
+active_model_runner: "ModelRunner | None" = None
 active_model_name: str | None = None  # ✅ Track the model name/path (normalized)
 
+# running inference jobs
+_background_tasks: set = set()
 
-def normalize_model_key(model_path: str) -> str:
-    """
-    Normalize model path to a consistent Redis key (ignores UUID prefix).
-    Example: custom_models/00abcd_bag.pt → bag.pt
-    """
-    return Path(model_path).name.split("_", 1)[-1] if "_" in Path(model_path).name else Path(model_path).name
+
+COPY_BUFSIZE = 8 * 1024 * 1024  # 8 MiB per read/write when spooling uploads to disk
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class _CountingWriter:
+    """File wrapper for shutil.copyfileobj: counts bytes, enforces a size cap, optionally hashes."""
+
+    def __init__(self, f, max_size: int | None = None, digest=None):
+        self.f = f
+        self.max_size = max_size
+        self.digest = digest
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise UploadTooLarge()
+        if self.digest is not None:
+            self.digest.update(data)
+        return self.f.write(data)
+
+
+def _save_upload(src, dst: Path, max_size: int | None = None, digest=None) -> int:
+    """Copy an uploaded file object to dst in large blocks (blocking; run in a thread)."""
+    with open(dst, "wb") as out_f:
+        writer = _CountingWriter(out_f, max_size, digest)
+        shutil.copyfileobj(src, writer, COPY_BUFSIZE)
+    return writer.size
 
 
 @router.post("/upload")
 async def upload_video(
+    request: Request,
     file: UploadFile = File(...),
     model: str = Form("yolov8n"),
-    custom_model: UploadFile = File(None)
+    custom_model: UploadFile = File(None),
+    persist_frames: bool = Form(PERSIST_FRAMES),
 ):
     suffix = Path(file.filename).suffix.lower()
     if suffix not in ALLOWED_EXT:
         raise HTTPException(status_code=400, detail=f"Unsupported video extension {suffix}")
 
+    # cheap early reject: with only the video in the body, Content-Length bounds its size
+    # (plus a little multipart framing)
+    content_length = int(request.headers.get("content-length") or 0)
+    if not custom_model and content_length > MAX_UPLOAD_SIZE + 64 * 1024:
+        raise HTTPException(status_code=400, detail="File too large")
+
     upload_dir = Path("uploads")
     upload_dir.mkdir(parents=True, exist_ok=True)
     job_id = uuid.uuid4().hex
     video_path = upload_dir / f"{job_id}{suffix}"
 
-    size = 0
-    with open(video_path, "wb") as out_f:
-        while True:
-            chunk = await file.read(1024 * 1024)
-            if not chunk:
-                break
-            size += len(chunk)
-            if size > MAX_UPLOAD_SIZE:
-                out_f.close()
-                video_path.unlink(missing_ok=True)
-                raise HTTPException(status_code=400, detail="File too large")
-            out_f.write(chunk)
+    try:
+        await asyncio.to_thread(_save_upload, file.file, video_path, MAX_UPLOAD_SIZE)
+    except UploadTooLarge:
+        video_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail="File too large")
 
     model_path = None
+    model_key = None
     global active_model_runner, active_model_name
 
     # Handle custom model upload
@@ -66,26 +101,28 @@ async def upload_video(
         model_dir.mkdir(parents=True, exist_ok=True)
         model_path = model_dir / f"{job_id}_{custom_model.filename}"
 
-        with open(model_path, "wb") as mf:
-            while chunk := await custom_model.read(1024 * 1024):
-                mf.write(chunk)
+        digest = hashlib.sha1()
+        await asyncio.to_thread(_save_upload, custom_model.file, model_path, None, digest)
 
         model = str(model_path)
-
-        # ✅ Initialize ModelRunner
-        active_model_runner = ModelRunner(model)
         active_model_name = normalize_model_key(model)
+        # same file name can carry different weights, so cache by name + content
+        model_key = f"{active_model_name}@{digest.hexdigest()[:16]}"
+
+        # ✅ Initialize (or reuse) ModelRunner
+        active_model_runner = get_model_runner(model, model_key)
         print(f"✅ Active custom model loaded: {model}")
 
     else:
         # ✅ Handle built-in model
-        active_model_runner = ModelRunner(model)
+        active_model_runner = get_model_runner(model)
         active_model_name = model
         print(f"✅ Active default model set: {model}")
 
-    # Start inference job
-    loop = asyncio.get_event_loop()
-    loop.create_task(run_inference_job(job_id, video_path, model))
+    # Start inference job (keep a reference so the task isn't garbage-collected mid-run)
+    task = asyncio.create_task(run_inference_job(job_id, video_path, model, model_key, persist_frames))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
     return JSONResponse({
         "job_id": job_id,
@@ -113,14 +150,11 @@ async def set_class_colors(request: Request):
             raise HTTPException(status_code=400, detail="Invalid color data format")
 
         # ✅ Normalize model key (ignore UUID prefix)
-        def normalize_model_key(model_path: str) -> str:
-            return Path(model_path).name.split("_", 1)[-1] if "_" in Path(model_path).name else Path(model_path).name
-
         normalized_key = normalize_model_key(model_name)
 
         redis = get_redis()
         colors_key = f"model:{normalized_key}:colors"
-        await redis.set(colors_key, json.dumps(colors))
+        await redis.set(colors_key, orjson.dumps(colors))
 
         print(f"🎨 Colors saved for {normalized_key}: {colors}")
         return JSONResponse({"message": f"Colors saved for {normalized_key}"})
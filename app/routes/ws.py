@@ -1,27 +1,38 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from app.tasks import register_ws, unregister_ws
-import json
+from app.tasks import register_ws, unregister_ws, ws_bin_message, LIVE_INIT_SEGMENTS, WS_BIN_H264
+import orjson
 
 router = APIRouter()
 
+# constant reply, serialized once
+DOWNLOAD_HINT_MSG = orjson.dumps(
+    {"type": "info", "message": "Download requested; call /download/<job_id> to retrieve file"}
+).decode()
+
 @router.websocket("/ws/jobs/{job_id}")
 async def websocket_endpoint(websocket: WebSocket, job_id: str):
     await websocket.accept()
-    register_ws(job_id, websocket)
     try:
+        # joined after the live H.264 stream started: the player needs its init segment before
+        # any fragment, so send it while this socket is still unregistered. With no segment yet,
+        # register with no await in between and the job's own broadcast delivers it.
+        init_segment = LIVE_INIT_SEGMENTS.get(job_id)
+        if init_segment:
+            await websocket.send_bytes(ws_bin_message(WS_BIN_H264, 0, init_segment))
+        register_ws(job_id, websocket)
         # send a welcome message
-        await websocket.send_text(json.dumps({"type":"info","message":"connected","job_id":job_id}))
+        await websocket.send_text(orjson.dumps({"type":"info","message":"connected","job_id":job_id}).decode())
         while True:
             # keep connection alive; clients usually don't send messages, but we await for pings
             data = await websocket.receive_text()
             # optionally client can send {"action":"ping"} or {"action":"download"}
             # For now ignore or echo
             try:
-                msg = json.loads(data)
+                msg = orjson.loads(data)
             except Exception:
                 msg = {}
             if msg.get("action") == "download":
-                await websocket.send_text(json.dumps({"type":"info", "message":"Download requested; call /download/<job_id> to retrieve file"}))
+                await websocket.send_text(DOWNLOAD_HINT_MSG)
     except WebSocketDisconnect:
         unregister_ws(job_id, websocket)
     except Exception:
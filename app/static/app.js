@@ -158,6 +158,7 @@ function getRandomColor() {
 function openWs(wsPath) {
   const url = (location.protocol === "https:" ? "wss://" : "ws://") + location.host + wsPath;
   ws = new WebSocket(url);
+  ws.binaryType = "arraybuffer";
 
   ws.onopen = () => {
     log("✅ WebSocket connected");
@@ -165,6 +166,11 @@ function openWs(wsPath) {
   };
 
   ws.onmessage = (ev) => {
+    // 🖼️ Binary messages: 5-byte header (u8 type, u32 little-endian frame index) + payload
+    if (ev.data instanceof ArrayBuffer) {
+      handleBinary(ev.data);
+      return;
+    }
     try {
       const msg = JSON.parse(ev.data);
       handleMsg(msg);
@@ -184,8 +190,6 @@ function handleMsg(msg) {
     const { frame = 0, total_frames = 0, pct = 0 } = msg;
     progressBar.style.width = pct + "%";
     progressInfo.textContent = `${frame} / ${total_frames} (${pct}%)`;
-  } else if (msg.type === "frame") {
-    liveFrame.src = "data:image/jpeg;base64," + msg.data;
   } else if (msg.type === "done") {
     metricsEl.textContent = JSON.stringify(msg.metrics, null, 2);
     downloadBtn.disabled = false;
@@ -196,6 +200,74 @@ function handleMsg(msg) {
   }
 }
 
+let liveFrameUrl = null;
+
+const WS_BIN_FRAME = 1;
+const WS_BIN_H264 = 2;
+
+function handleBinary(buf) {
+  const view = new DataView(buf);
+  const type = view.getUint8(0);
+  const frameIdx = view.getUint32(1, true);
+  if (type === WS_BIN_FRAME) showFrame(new Uint8Array(buf, 5), frameIdx);
+  else if (type === WS_BIN_H264) appendVideo(new Uint8Array(buf, 5));
+}
+
+// 🎞️ H.264 live stream: fragmented MP4 chunks appended to a MediaSource in arrival order
+const liveVideo = document.getElementById("live-video");
+let liveMse = null;
+
+function appendVideo(bytes) {
+  if (!liveMse) startLiveVideo();
+  liveMse.queue.push(bytes);
+  pumpLiveVideo();
+}
+
+function startLiveVideo() {
+  const mediaSource = new MediaSource();
+  liveMse = { sourceBuffer: null, queue: [] };
+  liveVideo.src = URL.createObjectURL(mediaSource);
+  liveVideo.classList.remove("hidden");
+  liveFrame.classList.add("hidden");
+  mediaSource.addEventListener("sourceopen", () => {
+    const sb = mediaSource.addSourceBuffer('video/mp4; codecs="avc1.42E01F"');
+    sb.mode = "sequence";
+    sb.addEventListener("updateend", pumpLiveVideo);
+    liveMse.sourceBuffer = sb;
+    pumpLiveVideo();
+  });
+  liveVideo.play().catch(() => {});
+}
+
+// seconds of already-played video kept in the SourceBuffer
+const LIVE_BUFFER_KEEP_S = 10;
+
+function pumpLiveVideo() {
+  const sb = liveMse.sourceBuffer;
+  if (!sb || sb.updating) return;
+  // drop played video so long jobs don't hit the SourceBuffer quota (updateend pumps again)
+  const trimTo = liveVideo.currentTime - LIVE_BUFFER_KEEP_S;
+  if (sb.buffered.length && sb.buffered.start(0) < trimTo - 1) {
+    sb.remove(0, trimTo);
+    return;
+  }
+  if (!liveMse.queue.length) return;
+  sb.appendBuffer(liveMse.queue.shift());
+}
+
+function showFrame(jpegBytes, frameIdx) {
+  // the server falls back to JPEG frames if its H.264 preview stops
+  if (liveFrame.classList.contains("hidden")) {
+    liveVideo.classList.add("hidden");
+    liveFrame.classList.remove("hidden");
+  }
+  const blob = new Blob([jpegBytes], { type: "image/jpeg" });
+  if (liveFrameUrl) URL.revokeObjectURL(liveFrameUrl);
+  liveFrameUrl = URL.createObjectURL(blob);
+  liveFrame.src = liveFrameUrl;
+  liveFrame.dataset.frame = frameIdx;
+}
+
 downloadBtn.addEventListener("click", async () => {
   if (!jobId) return;
   downloadBtn.disabled = true;
@@ -1,82 +1,261 @@
 import asyncio
-import base64
-import json
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, Any
 
 import cv2
 import numpy as np
+import orjson
 
 from app.utils.redis_client import get_redis
-from app.utils.video import read_video_metadata
-from app.utils.metrics import now_ts, compute_metrics
-from app.config import REDIS_TTL_SECONDS, MODEL_MAP
+from app.utils.video import (
+    read_video_metadata, open_video_capture, start_h264_encoder, write_raw_frame, LiveH264Stream,
+    select_video_codec, mark_codec_failed,
+)
+from app.utils.frame_ring import FrameRing
+from app.utils.metrics import now_ts, perf_ns, compute_metrics
+from app.config import (
+    TMP_DIR, REDIS_TTL_SECONDS, TTL_REFRESH_SECONDS, REDIS_PUSH_BATCH, REDIS_PUSH_INTERVAL_S, PERSIST_FRAMES,
+    FRAME_RING_SLOTS, FRAME_RING_SLOT_BYTES,
+    MODEL_MAP,
+    INFER_BATCH_SIZE, INFER_BATCH_TIMEOUT_S, FRAME_QUEUE_SIZE, WS_SEND_TIMEOUT_S, LIVE_FRAME_MAX_WIDTH,
+    LIVE_STREAM_FORMAT,
+)
+
+
+class JobConns:
+    """A job's open WebSockets; snapshot is rebuilt on (un)register so sends don't copy the set."""
+    __slots__ = ("conns", "snapshot")
+
+    def __init__(self):
+        self.conns = set()
+        self.snapshot = ()
+
 
 # In-memory WebSocket registry for active clients
-WS_REGISTRY: Dict[str, set] = {}
+WS_REGISTRY: Dict[str, JobConns] = {}
+# close() calls for sockets dropped by _broadcast (keeps the tasks referenced)
+_closing_ws: set = set()
+
+# Binary WS messages start with a 5-byte header: message type (u8) + frame index (u32, little-endian)
+WS_BIN_FRAME = 1  # payload: one JPEG
+WS_BIN_H264 = 2  # payload: fragmented MP4 bytes (init segment or media fragments)
+_WS_BIN_HEADER = struct.Struct("<BI")
+
+# MP4 init segment of each job's live H.264 stream, replayed to viewers that join late
+LIVE_INIT_SEGMENTS: Dict[str, bytes] = {}
+
+# Loaded ModelRunners shared across uploads and jobs, least recently used evicted first
+MODEL_CACHE: "OrderedDict[str, Any]" = OrderedDict()
+MODEL_CACHE_SIZE = 4
+
+# JPEG encoding for live frames: baseline, no Huffman optimization pass.
+# PyTurboJPEG (libjpeg-turbo SIMD) is used when installed.
+JPEG_QUALITY = 80
+_JPEG_PARAMS = [
+    int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY,
+    int(cv2.IMWRITE_JPEG_OPTIMIZE), 0,
+    int(cv2.IMWRITE_JPEG_PROGRESSIVE), 0,
+]
+try:
+    from turbojpeg import TurboJPEG
+    _turbojpeg = TurboJPEG()
+except Exception:
+    _turbojpeg = None
+
+# Worker threads for blocking OpenCV calls (decode and JPEG encode both release the GIL)
+io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="capture")
+encoder_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="jpeg")
+# Forward passes run here so a batch on the GPU doesn't stall the event loop
+infer_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="infer")
 
 
 # ============================================================
 # 🟢 WebSocket Management
 # ============================================================
 def register_ws(job_id: str, ws):
-    if job_id not in WS_REGISTRY:
-        WS_REGISTRY[job_id] = set()
-    WS_REGISTRY[job_id].add(ws)
+    entry = WS_REGISTRY.get(job_id)
+    if entry is None:
+        entry = WS_REGISTRY[job_id] = JobConns()
+    entry.conns.add(ws)
+    entry.snapshot = tuple(entry.conns)
 
 
 def unregister_ws(job_id: str, ws):
-    if job_id in WS_REGISTRY:
-        WS_REGISTRY[job_id].discard(ws)
-        if not WS_REGISTRY[job_id]:
-            del WS_REGISTRY[job_id]
+    entry = WS_REGISTRY.get(job_id)
+    if entry is None:
+        return
+    entry.conns.discard(ws)
+    if entry.conns:
+        entry.snapshot = tuple(entry.conns)
+    else:
+        del WS_REGISTRY[job_id]
+
+
+def ws_bin_message(msg_type: int, frame_idx: int, payload: bytes) -> bytes:
+    """Binary WS message: 5-byte header + payload."""
+    return _WS_BIN_HEADER.pack(msg_type, frame_idx) + payload
+
+
+async def _broadcast(job_id: str, conns: tuple, payload, binary: bool = False):
+    """
+    Send one payload to every socket concurrently; drop sockets whose send failed
+    or stalled past WS_SEND_TIMEOUT_S (so one stuck viewer can't hold up the job).
+    """
+    results = await asyncio.gather(
+        *(
+            asyncio.wait_for(ws.send_bytes(payload) if binary else ws.send_text(payload), WS_SEND_TIMEOUT_S)
+            for ws in conns
+        ),
+        return_exceptions=True,
+    )
+    for ws, r in zip(conns, results):
+        if isinstance(r, Exception):
+            unregister_ws(job_id, ws)
+            # tell the client it was dropped (a timed-out send may have been cut mid-message);
+            # closed in the background so a stuck socket can't stall the job here either
+            task = asyncio.create_task(_close_ws(ws))
+            _closing_ws.add(task)
+            task.add_done_callback(_closing_ws.discard)
+
+
+async def _close_ws(ws):
+    try:
+        await asyncio.wait_for(ws.close(code=1011), WS_SEND_TIMEOUT_S)
+    except Exception:
+        pass
 
 
 async def send_ws_message(job_id: str, message: Dict[str, Any]):
-    conns = list(WS_REGISTRY.get(job_id, []))
-    if not conns:
+    entry = WS_REGISTRY.get(job_id)
+    if entry is None:
         return
-    msg = json.dumps(message)
-    for ws in conns:
-        try:
-            await ws.send_text(msg)
-        except Exception:
-            pass
+    await _broadcast(job_id, entry.snapshot, orjson.dumps(message).decode())
 
 
-async def send_ws_frame_b64(job_id: str, frame_b64: str, frame_idx: int):
-    conns = list(WS_REGISTRY.get(job_id, []))
-    if not conns:
+async def send_ws_text(job_id: str, text: str):
+    """Send an already-serialized JSON message."""
+    entry = WS_REGISTRY.get(job_id)
+    if entry is None:
         return
-    payload = json.dumps({"type": "frame", "frame": frame_idx, "data": frame_b64})
-    for ws in conns:
-        try:
-            await ws.send_text(payload)
-        except Exception:
-            pass
+    await _broadcast(job_id, entry.snapshot, text)
+
+
+async def send_ws_frame_bin(job_id: str, frame_bytes: bytes, frame_idx: int, msg_type: int = WS_BIN_FRAME):
+    """Send a frame as one binary message: 5-byte header + raw JPEG (or MP4 fragment) bytes."""
+    entry = WS_REGISTRY.get(job_id)
+    if entry is None:
+        return
+    payload = ws_bin_message(msg_type, frame_idx, frame_bytes)
+    await _broadcast(job_id, entry.snapshot, payload, binary=True)
 
 
 # ============================================================
 # 🧠 Inference Job
 # ============================================================
+@lru_cache(maxsize=128)
 def normalize_model_key(model_path: str) -> str:
     """Return consistent model key without UUID prefix."""
-    return Path(model_path).name.split("_", 1)[-1] if "_" in Path(model_path).name else Path(model_path).name
+    name = Path(model_path).name
+    _, _, tail = name.partition("_")
+    return tail or name
+
+
+def get_model_runner(model_name: str, cache_key: str | None = None):
+    """
+    Return a loaded ModelRunner for model_name, reusing a cached instance when possible.
+    cache_key defaults to the normalized model key; pass a more specific one (e.g. with a
+    content digest) when different weights can share a file name.
+    """
+    key = cache_key or normalize_model_key(model_name)
+    runner = MODEL_CACHE.get(key)
+    if runner is not None:
+        MODEL_CACHE.move_to_end(key)
+        return runner
+
+    from app.models.runner import ModelRunner
+    runner = ModelRunner(MODEL_MAP.get(model_name, model_name))
+    MODEL_CACHE[key] = runner
+    while len(MODEL_CACHE) > MODEL_CACHE_SIZE:
+        evicted, _ = MODEL_CACHE.popitem(last=False)
+        print(f"♻️ Evicted cached model: {evicted}")
+    return runner
+
+
+def _live_size(w: int, h: int, even: bool = False) -> tuple:
+    """
+    Live-view frame size: at most LIVE_FRAME_MAX_WIDTH wide (the mp4, Redis cache and frame
+    ring keep the source resolution). even=True rounds the sides down to even numbers, which
+    the yuv420p H.264 preview needs.
+    """
+    if LIVE_FRAME_MAX_WIDTH and w > LIVE_FRAME_MAX_WIDTH:
+        h = max(1, round(h * LIVE_FRAME_MAX_WIDTH / w))
+        w = LIVE_FRAME_MAX_WIDTH
+    if even:
+        w, h = max(2, w & ~1), max(2, h & ~1)
+    return w, h
+
+
+def _encode_jpeg(frame) -> bytes | None:
+    if _turbojpeg is not None:
+        return _turbojpeg.encode(frame, quality=JPEG_QUALITY)
+    success, jpg = cv2.imencode(".jpg", frame, _JPEG_PARAMS)
+    return jpg.tobytes() if success else None
+
+
+def _encode_frame_jpegs(frame, full: bool, preview: bool) -> tuple:
+    """
+    (full-resolution JPEG, live-view JPEG), each None unless requested. Only the copy sent
+    to WebSocket viewers is downscaled; one encode serves both when the sizes match.
+    """
+    h, w = frame.shape[:2]
+    size = _live_size(w, h)
+    same = size == (w, h)
+    full_jpg = _encode_jpeg(frame) if full or (preview and same) else None
+    if not preview:
+        return full_jpg, None
+    if same:
+        return full_jpg, full_jpg
+    return full_jpg, _encode_jpeg(cv2.resize(frame, size, interpolation=cv2.INTER_AREA))
+
+
+def _remove_stale_videos():
+    """Delete finished job videos whose meta has expired (never downloaded, so never cleaned up)."""
+    cutoff = time.time() - REDIS_TTL_SECONDS
+    for path in TMP_DIR.glob("*.mp4"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass
 
 
-async def run_inference_job(job_id: str, video_path: Path, model_name: str):
+async def run_inference_job(
+    job_id: str,
+    video_path: Path,
+    model_name: str,
+    model_key: str | None = None,
+    persist_frames: bool = PERSIST_FRAMES,
+):
     redis = get_redis()
     meta_key = f"job:{job_id}:meta"
     frames_key = f"job:{job_id}:frames"
 
-    await redis.hset(meta_key, mapping={"model": model_name, "status": "running"})
+    # persist_frames=False: live-only job, frames go to WebSockets (and the mp4) but never to Redis
+    await redis.hset(meta_key, mapping={"model": model_name, "status": "running", "persist_frames": int(persist_frames)})
     await redis.expire(meta_key, REDIS_TTL_SECONDS)
-    await redis.expire(frames_key, REDIS_TTL_SECONDS)
+    await asyncio.get_running_loop().run_in_executor(io_pool, _remove_stale_videos)
 
     try:
         meta = read_video_metadata(video_path)
         total_frames = meta.get("total_frames") or 0
         fps = meta.get("fps") or 30.0
+        await redis.hset(meta_key, mapping={"fps": fps})
     except Exception as exc:
         await redis.hset(meta_key, mapping={"status": "failed", "error": str(exc)})
         await send_ws_message(job_id, {"type": "error", "message": str(exc)})
@@ -90,7 +269,7 @@ async def run_inference_job(job_id: str, video_path: Path, model_name: str):
     try:
         if await redis.exists(colors_key):
             color_data = await redis.get(colors_key)
-            custom_colors = json.loads(color_data)
+            custom_colors = orjson.loads(color_data)
             print(f"✅ Loaded custom colors for {normalized_key}: {custom_colors}")
         else:
             custom_colors = {}
@@ -100,13 +279,10 @@ async def run_inference_job(job_id: str, video_path: Path, model_name: str):
         custom_colors = {}
 
     # ============================================================
-    # 🚀 Load ModelRunner with colors
+    # 🚀 Load ModelRunner (shared between jobs: colors are passed per call, not set on it)
     # ============================================================
-    from app.models.runner import ModelRunner
-    model_spec = MODEL_MAP.get(model_name, model_name)
     try:
-        runner = ModelRunner(model_spec)
-        runner.class_colors = custom_colors
+        runner = get_model_runner(model_name, model_key)
     except Exception as e:
         await redis.hset(meta_key, mapping={"status": "failed", "error": str(e)})
         await send_ws_message(job_id, {"type": "error", "message": f"Model load failed: {e}"})
@@ -115,65 +291,290 @@ async def run_inference_job(job_id: str, video_path: Path, model_name: str):
     # ============================================================
     # 🎥 Process Video
     # ============================================================
-    cap = cv2.VideoCapture(str(video_path))
-    if not cap.isOpened():
+    cap = await asyncio.get_running_loop().run_in_executor(io_pool, open_video_capture, video_path)
+    if cap is None:
         await redis.hset(meta_key, mapping={"status": "failed", "error": "Cannot open video"})
         await send_ws_message(job_id, {"type": "error", "message": "Cannot open video"})
         return
 
+    # annotated frames are piped into one ffmpeg process as they are produced,
+    # so /download can serve the finished mp4 without re-encoding anything
+    out_video = TMP_DIR / f"{job_id}.mp4"
+    encoder = None
+    encoder_codec = None
+
+    # optional shared-memory ring for consumers on this host (see app/utils/frame_ring.py)
+    idx_key = f"job:{job_id}:idx"
+    ring = None
+    if FRAME_RING_SLOTS > 0:
+        try:
+            ring = FrameRing.create(f"frames_{job_id}", FRAME_RING_SLOTS, FRAME_RING_SLOT_BYTES)
+            await redis.hset(meta_key, mapping={
+                "frame_ring": ring.name, "frame_ring_slots": ring.slots, "frame_ring_slot_bytes": ring.slot_bytes,
+            })
+        except Exception as e:
+            print(f"⚠️ Could not create shared-memory frame ring: {e}")
+
     start_ts = now_ts()
-    t_pre, t_inf, t_post = [], [], []
+    # decode (pre) and encode/publish (post) timings as running (total_ns, frame_count) sums
+    pre_ns = pre_cnt = post_ns = post_cnt = 0
+    # per-frame inference time (ns, batch time split evenly), indexed by frame; grown if the
+    # container under-reported its frame count
+    inf_times = np.empty(max(total_frames, 0) or 4096, dtype=np.float64)
+    inf_cnt = 0
     processed = 0
-    frame_idx = 0
-
-    try:
-        while True:
+    stream = {}  # per-video difference-detector state for runner.predict_batch
+    last_ttl_refresh = None  # first pushed frame creates frames_key, so arm its TTL then
+
+    # capture → inference → publish run as concurrent stages joined by bounded queues;
+    # None on a queue marks end of stream
+    raw_q: asyncio.Queue = asyncio.Queue(maxsize=FRAME_QUEUE_SIZE)
+    post_q: asyncio.Queue = asyncio.Queue(maxsize=FRAME_QUEUE_SIZE)
+
+    # decode buffers are reused round-robin; the ring is larger than the number of frames
+    # that can be in flight (both queues, one batch, one being read, one being published)
+    frame_pool = [None] * (2 * FRAME_QUEUE_SIZE + INFER_BATCH_SIZE + 2)
+    # cap.read runs on io_pool; the lock keeps release() from racing a read
+    cap_lock = threading.Lock()
+
+    # only cv2.VideoCapture can decode into a caller-provided buffer
+    reuse_buffers = isinstance(cap, cv2.VideoCapture)
+
+    def read_frame(buf):
+        with cap_lock:
+            if reuse_buffers:
+                return cap.read() if buf is None else cap.read(buf)
             ret, frame = cap.read()
+        # boxes are drawn in place, so frames handed out read-only need their own copy
+        if ret and not frame.flags.writeable:
+            frame = frame.copy()
+        return ret, frame
+
+    def release_capture():
+        with cap_lock:
+            cap.release()
+
+    async def capture_stage():
+        nonlocal pre_ns, pre_cnt
+        loop = asyncio.get_running_loop()
+        frame_idx = 0
+        while True:
+            slot = frame_idx % len(frame_pool)
+            t0 = perf_ns()
+            ret, frame = await loop.run_in_executor(io_pool, read_frame, frame_pool[slot])
             if not ret:
                 break
-
-            t0 = now_ts()
+            pre_ns += perf_ns() - t0
+            pre_cnt += 1
+            frame_pool[slot] = frame
+            await raw_q.put((frame_idx, frame))
+            frame_idx += 1
+        await raw_q.put(None)
+
+    async def infer_stage():
+        nonlocal inf_times, inf_cnt
+        loop = asyncio.get_running_loop()
+        end_of_stream = False
+        while not end_of_stream:
+            item = await raw_q.get()
+            if item is None:
+                break
+            batch = [item]
+
+            # fill the batch, but don't hold a partial one longer than the timeout
+            deadline = now_ts() + INFER_BATCH_TIMEOUT_S
+            while len(batch) < INFER_BATCH_SIZE:
+                timeout = deadline - now_ts()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(raw_q.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    end_of_stream = True
+                    break
+                batch.append(item)
+
+            frames = [frame for _, frame in batch]
+            t0 = perf_ns()
             try:
-                res = runner.predict(frame)
+                results = await loop.run_in_executor(infer_pool, runner.predict_batch, frames, stream, custom_colors)
             except Exception as e:
-                print(f"⚠️ Inference failed on frame {frame_idx}: {e}")
-                res = {"result_frame": frame}
-            t_inf.append(now_ts() - t0)
-
-            out_frame = res.get("result_frame", frame)
-            success, jpg = cv2.imencode(".jpg", out_frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-            if not success:
-                frame_idx += 1
-                continue
-
-            jpg_bytes = jpg.tobytes()
-            await redis.rpush(frames_key, jpg_bytes)
-            await redis.expire(frames_key, REDIS_TTL_SECONDS)
-            await redis.hset(meta_key, mapping={"processed_frames": frame_idx + 1, "total_frames": total_frames})
-            await redis.expire(meta_key, REDIS_TTL_SECONDS)
-
-            b64 = base64.b64encode(jpg_bytes).decode("ascii")
-            await send_ws_frame_b64(job_id, b64, frame_idx)
-
-            pct = ((frame_idx + 1) / total_frames * 100.0) if total_frames else 0.0
-            await send_ws_message(
-                job_id,
-                {"type": "progress", "frame": frame_idx + 1, "total_frames": total_frames, "pct": round(pct, 2)},
-            )
-
-            frame_idx += 1
-            processed += 1
-            await asyncio.sleep(0)
+                print(f"⚠️ Inference failed on frames {batch[0][0]}-{batch[-1][0]}: {e}")
+                results = [{"result_frame": f} for f in frames]
+            last = batch[-1][0]
+            if last >= len(inf_times):
+                inf_times = np.resize(inf_times, max(last + 1, 2 * len(inf_times)))
+            inf_times[batch[0][0]:last + 1] = (perf_ns() - t0) / len(batch)
+            inf_cnt = last + 1
+
+            for (frame_idx, frame), res in zip(batch, results):
+                await post_q.put((frame_idx, res.get("result_frame", frame), res.get("skipped", False)))
+        await post_q.put(None)
+
+    async def flush_frames(pending: list, ring_entries: list, last_idx: int):
+        """Push buffered JPEGs with one variadic RPUSH, plus meta/TTL updates, in one round trip."""
+        nonlocal last_ttl_refresh
+        async with redis.pipeline(transaction=False) as pipe:
+            if pending:
+                pipe.rpush(frames_key, *pending)
+            for frame, slot, length in ring_entries:
+                pipe.xadd(idx_key, {"frame": frame, "slot": slot, "len": length}, maxlen=ring.slots, approximate=True)
+            pipe.hset(meta_key, mapping={"processed_frames": last_idx + 1, "total_frames": total_frames})
+            # TTL refresh is idempotent; re-arm it every few seconds, not every flush
+            now = now_ts()
+            if last_ttl_refresh is None or now - last_ttl_refresh > TTL_REFRESH_SECONDS:
+                if persist_frames:
+                    pipe.expire(frames_key, REDIS_TTL_SECONDS)
+                if ring is not None:
+                    pipe.expire(idx_key, REDIS_TTL_SECONDS)
+                pipe.expire(meta_key, REDIS_TTL_SECONDS)
+                last_ttl_refresh = now
+            await pipe.execute()
+        pending.clear()
+        ring_entries.clear()
+
+    async def publish_stage():
+        nonlocal processed, encoder, encoder_codec, post_ns, post_cnt
+        loop = asyncio.get_running_loop()
+        last_jpgs = None  # (full, preview) JPEGs of the last encoded frame
+        live = None  # LiveH264Stream when LIVE_STREAM_FORMAT is "h264"
+        # progress (and, when persisting, JPEGs) waiting for the next batched Redis push
+        pending, ring_entries, batched, batch_since, last_idx = [], [], 0, 0.0, -1
+        # progress messages have a fixed shape; only frame and pct change per frame
+        progress_prefix = f'{{"type":"progress","total_frames":{total_frames},"frame":'
+        try:
+            while True:
+                item = await post_q.get()
+                if item is None:
+                    break
+                frame_idx, out_frame, skipped = item
+                t0 = perf_ns()
+
+                h, w = out_frame.shape[:2]
+                if encoder is None and frame_idx == 0:
+                    try:
+                        encoder_codec = await loop.run_in_executor(io_pool, select_video_codec)
+                        encoder = await start_h264_encoder(out_video, w, h, fps, encoder_codec)
+                    except Exception as e:
+                        print(f"⚠️ Could not start ffmpeg encoder, download will re-encode cached frames: {e}")
+                if encoder is not None:
+                    try:
+                        await write_raw_frame(encoder, out_frame)
+                    except Exception as e:
+                        print(f"⚠️ ffmpeg encoder stopped on frame {frame_idx}: {e}")
+                        mark_codec_failed(encoder_codec)
+                        encoder.kill()
+                        encoder = None
+                        out_video.unlink(missing_ok=True)
+
+                if live is None and frame_idx == 0 and LIVE_STREAM_FORMAT == "h264":
+                    try:
+                        live = LiveH264Stream(*_live_size(w, h, even=True), fps)
+                        LIVE_INIT_SEGMENTS[job_id] = live.init_segment
+                        await send_ws_frame_bin(job_id, live.init_segment, frame_idx, WS_BIN_H264)
+                    except Exception as e:
+                        print(f"⚠️ Live H.264 stream unavailable, sending JPEG frames: {e}")
+                        live = None
+                if live is not None:
+                    try:
+                        chunk = await loop.run_in_executor(encoder_pool, live.encode, out_frame)
+                    except Exception as e:
+                        # the preview is best-effort: carry on with JPEG frames from here
+                        print(f"⚠️ Live H.264 stream stopped on frame {frame_idx}, sending JPEG frames: {e}")
+                        LIVE_INIT_SEGMENTS.pop(job_id, None)
+                        live = None
+                    else:
+                        if chunk:
+                            await send_ws_frame_bin(job_id, chunk, frame_idx, WS_BIN_H264)
+
+                # full-resolution JPEGs feed the Redis frame cache and the shared-memory ring;
+                # WebSocket viewers (when not streaming H.264) get a downscaled one
+                need_full = persist_frames or ring is not None
+                need_preview = live is None
+                if need_full or need_preview:
+                    # frames the difference detector judged identical to the last inferred one
+                    # reuse its JPEGs (the mp4 above still gets the real pixels)
+                    if (skipped and last_jpgs is not None
+                            and (last_jpgs[0] is not None or not need_full)
+                            and (last_jpgs[1] is not None or not need_preview)):
+                        full_jpg, preview_jpg = last_jpgs
+                    else:
+                        full_jpg, preview_jpg = await loop.run_in_executor(
+                            encoder_pool, _encode_frame_jpegs, out_frame, need_full, need_preview
+                        )
+                        if (need_full and full_jpg is None) or (need_preview and preview_jpg is None):
+                            continue
+                        last_jpgs = (full_jpg, preview_jpg)
+                    if need_preview:
+                        await send_ws_frame_bin(job_id, preview_jpg, frame_idx)
+                    if persist_frames:
+                        pending.append(full_jpg)
+                    if ring is not None:
+                        slot = ring.write(frame_idx, full_jpg)
+                        if slot is not None:
+                            ring_entries.append((frame_idx, slot, len(full_jpg)))
+
+                if not batched:
+                    batch_since = now_ts()
+                batched += 1
+                last_idx = frame_idx
+                if batched >= REDIS_PUSH_BATCH or now_ts() - batch_since >= REDIS_PUSH_INTERVAL_S:
+                    await flush_frames(pending, ring_entries, last_idx)
+                    batched = 0
+
+                pct = ((frame_idx + 1) / total_frames * 100.0) if total_frames else 0.0
+                await send_ws_text(job_id, f"{progress_prefix}{frame_idx + 1},\"pct\":{pct:.2f}}}")
+
+                processed += 1
+                post_ns += perf_ns() - t0
+                post_cnt += 1
+        finally:
+            # don't lose the tail of the video (also runs when the stage is cancelled)
+            if batched:
+                await flush_frames(pending, ring_entries, last_idx)
+            LIVE_INIT_SEGMENTS.pop(job_id, None)
+            if live is not None:
+                try:
+                    tail = await loop.run_in_executor(encoder_pool, live.close)
+                    if tail:
+                        await send_ws_frame_bin(job_id, tail, last_idx, WS_BIN_H264)
+                except Exception as e:
+                    print(f"⚠️ Live H.264 stream failed to finalize: {e}")
+
+    stages = [asyncio.create_task(stage()) for stage in (capture_stage, infer_stage, publish_stage)]
+    try:
+        done, pending = await asyncio.wait(stages, return_when=asyncio.FIRST_EXCEPTION)
+        # a failed stage would leave its neighbours blocked on a queue forever
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in done:
+            task.result()
 
     except Exception as e:
         await redis.hset(meta_key, mapping={"status": "failed", "error": str(e)})
         await send_ws_message(job_id, {"type": "error", "message": str(e)})
 
     finally:
-        cap.release()
+        await asyncio.get_running_loop().run_in_executor(io_pool, release_capture)
+        if ring is not None:
+            ring.close()
+
+    video_ready = False
+    if encoder is not None:
+        try:
+            encoder.stdin.close()
+            video_ready = await encoder.wait() == 0
+            if not video_ready:
+                # /download re-encodes the cached frames, with libx264 if this was a hardware encoder
+                mark_codec_failed(encoder_codec)
+        except Exception as e:
+            print(f"⚠️ ffmpeg encoder failed to finalize: {e}")
 
     end_ts = now_ts()
-    metrics = compute_metrics(t_pre, t_inf, t_post, start_ts, end_ts, processed, model_name)
+    metrics = compute_metrics((pre_ns, pre_cnt), inf_times[:inf_cnt], (post_ns, post_cnt), start_ts, end_ts, processed, model_name)
 
     await redis.hset(
         meta_key,
@@ -183,9 +584,11 @@ async def run_inference_job(job_id: str, video_path: Path, model_name: str):
             "total_frames": total_frames,
             "start_ts": start_ts,
             "end_ts": end_ts,
+            "video_path": str(out_video) if video_ready else "",
             **{k: str(v) for k, v in metrics.items()},
         },
     )
     await redis.expire(meta_key, REDIS_TTL_SECONDS)
-    await redis.expire(frames_key, REDIS_TTL_SECONDS)
+    if persist_frames:
+        await redis.expire(frames_key, REDIS_TTL_SECONDS)
     await send_ws_message(job_id, {"type": "done", "metrics": metrics})
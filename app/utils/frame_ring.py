@@ -0,0 +1,65 @@
+import struct
+from multiprocessing import shared_memory
+
+# every slot starts with frame index (u32) + payload length (u32), both little-endian
+_SLOT_HEADER = struct.Struct("<II")
+_WRITING = 0xFFFFFFFF  # frame index while a slot is being rewritten
+
+
+class FrameRing:
+    """
+    Fixed-slot ring of JPEG frames in POSIX shared memory, for consumers on the same host.
+    Frame N lives in slot N % slots until it is overwritten; the producer publishes
+    (frame, slot, len) entries to Redis and readers check the slot's frame index to
+    detect that they fell behind.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, slots: int, slot_bytes: int, owner: bool = False):
+        self.shm = shm
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = owner
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @classmethod
+    def create(cls, name: str, slots: int, slot_bytes: int) -> "FrameRing":
+        shm = shared_memory.SharedMemory(name=name, create=True, size=slots * slot_bytes)
+        return cls(shm, slots, slot_bytes, owner=True)
+
+    @classmethod
+    def attach(cls, name: str, slots: int, slot_bytes: int) -> "FrameRing":
+        return cls(shared_memory.SharedMemory(name=name), slots, slot_bytes)
+
+    def write(self, frame_idx: int, data: bytes) -> int | None:
+        """Copy one frame into its slot; returns the slot, or None if the frame doesn't fit."""
+        if _SLOT_HEADER.size + len(data) > self.slot_bytes:
+            return None
+        slot = frame_idx % self.slots
+        off = slot * self.slot_bytes
+        buf = self.shm.buf
+        # mark the slot busy, copy, then publish the real header (see read())
+        _SLOT_HEADER.pack_into(buf, off, _WRITING, 0)
+        buf[off + _SLOT_HEADER.size:off + _SLOT_HEADER.size + len(data)] = data
+        _SLOT_HEADER.pack_into(buf, off, frame_idx, len(data))
+        return slot
+
+    def read(self, slot: int) -> tuple | None:
+        """Return (frame_idx, bytes) stored in slot, or None if it was being rewritten meanwhile."""
+        off = slot * self.slot_bytes
+        frame_idx, length = _SLOT_HEADER.unpack_from(self.shm.buf, off)
+        if frame_idx == _WRITING:
+            return None
+        start = off + _SLOT_HEADER.size
+        data = bytes(self.shm.buf[start:start + length])
+        if _SLOT_HEADER.unpack_from(self.shm.buf, off)[0] != frame_idx:
+            return None
+        return frame_idx, data
+
+    def close(self):
+        """Detach; the owner also unlinks the segment (readers keep existing mappings)."""
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
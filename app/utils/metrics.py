@@ -1,15 +1,33 @@
 import time
-from typing import List, Dict
+from typing import Dict, Tuple
+
+import numpy as np
 
 def now_ts() -> float:
     return time.time()
 
-def compute_metrics(t_preprocess: List[float], t_infer: List[float], t_post: List[float], start_ts: float, end_ts: float, total_frames: int, model_name: str) -> Dict:
+def perf_ns() -> int:
+    """Monotonic high-resolution clock for stage timings (integer ns)."""
+    return time.perf_counter_ns()
+
+def _avg_s(timing: Tuple[int, int]) -> float:
+    total_ns, count = timing
+    return total_ns / count / 1e9 if count else 0.0
+
+def compute_metrics(t_preprocess: Tuple[int, int], t_infer: np.ndarray, t_post: Tuple[int, int], start_ts: float, end_ts: float, total_frames: int, model_name: str) -> Dict:
+    """
+    Pre/post timings are (total_ns, frame_count) running sums;
+    t_infer holds one inference time per frame (ns).
+    """
     total_time = end_ts - start_ts
     avg_fps = total_frames / total_time if total_time > 0 else 0.0
-    avg_pre = sum(t_preprocess) / len(t_preprocess) if t_preprocess else 0.0
-    avg_inf = sum(t_infer) / len(t_infer) if t_infer else 0.0
-    avg_post = sum(t_post) / len(t_post) if t_post else 0.0
+    avg_pre = _avg_s(t_preprocess)
+    avg_post = _avg_s(t_post)
+    if len(t_infer):
+        avg_inf = float(t_infer.mean()) / 1e9
+        p50_inf, p95_inf = (float(v) / 1e9 for v in np.percentile(t_infer, (50, 95)))
+    else:
+        avg_inf = p50_inf = p95_inf = 0.0
 
     return {
         "model": model_name,
@@ -18,5 +36,7 @@ def compute_metrics(t_preprocess: List[float], t_infer: List[float], t_post: Lis
         "avg_fps": round(avg_fps, 4),
         "avg_preprocess_ms": round(avg_pre * 1000, 3),
         "avg_infer_ms": round(avg_inf * 1000, 3),
+        "p50_infer_ms": round(p50_inf * 1000, 3),
+        "p95_infer_ms": round(p95_inf * 1000, 3),
         "avg_postprocess_ms": round(avg_post * 1000, 3),
     }
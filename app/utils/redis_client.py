@@ -1,10 +1,15 @@
 import redis.asyncio as redis
-from app.config import REDIS_URL
+from app.config import REDIS_URL, REDIS_MAX_CONNECTIONS
 
 _redis: redis.Redis | None = None
 
 def get_redis() -> redis.Redis:
     global _redis
     if _redis is None:
-        _redis = redis.from_url(REDIS_URL, decode_responses=False)  # store bytes
+        # concurrent jobs each check out their own connection per pipeline;
+        # past max_connections callers wait for a free one instead of erroring
+        pool = redis.BlockingConnectionPool.from_url(
+            REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS, decode_responses=False  # store bytes
+        )
+        _redis = redis.Redis(connection_pool=pool)
     return _redis
@@ -1,10 +1,113 @@
+import asyncio
 import cv2
+import numpy as np
 import os
+import subprocess
 import uuid
+from fractions import Fraction
+from functools import lru_cache
 from pathlib import Path
 from typing import Tuple
 
-from app.config import UPLOAD_DIR, TMP_DIR, FFMPEG_BIN
+from app.config import (
+    UPLOAD_DIR, FFMPEG_BIN, FFMPEG_VCODEC, FFMPEG_PRESET, FFMPEG_VAAPI_DEVICE, VIDEO_DECODER,
+)
+
+# PyAV is optional; without it live frames are always sent as JPEG
+try:
+    import av
+except ImportError:
+    av = None
+
+# frames fetched per LRANGE when re-encoding cached frames from Redis
+STITCH_PAGE_SIZE = 256
+
+# hardware H.264 encoders in the order FFMPEG_VCODEC=auto prefers them
+HW_H264_ENCODERS = ("h264_nvenc", "h264_videotoolbox", "h264_qsv", "h264_vaapi")
+DEFAULT_PRESETS = {"libx264": "veryfast", "h264_nvenc": "fast", "h264_qsv": "veryfast"}
+
+@lru_cache(maxsize=1)
+def available_encoders() -> frozenset:
+    """Video encoder names compiled into the ffmpeg binary (probed once)."""
+    try:
+        out = subprocess.run([FFMPEG_BIN, "-hide_banner", "-encoders"],
+                             capture_output=True, text=True, timeout=10).stdout
+    except Exception as e:
+        print(f"⚠️ Could not probe ffmpeg encoders: {e}")
+        return frozenset()
+    names = set()
+    for line in out.splitlines():
+        parts = line.split()
+        # encoder rows look like " V....D libx264   libx264 H.264 / AVC ..."
+        if len(parts) >= 2 and parts[0].startswith("V") and len(parts[0]) == 6:
+            names.add(parts[1])
+    return frozenset(names)
+
+# encoders that failed at runtime; select_video_codec() skips them from then on
+_FAILED_CODECS: set = set()
+
+@lru_cache(maxsize=None)
+def encoder_works(codec: str) -> bool:
+    """
+    Trial-encode one synthetic frame. -encoders only lists what the binary was built with
+    (stock distro builds list h264_nvenc), not what this host's hardware can run.
+    """
+    cmd = [
+        FFMPEG_BIN, "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", "nullsrc=s=256x256:d=1", "-frames:v", "1",
+        *video_encode_args(codec),
+        "-f", "null", "-",
+    ]
+    try:
+        return subprocess.run(cmd, capture_output=True, timeout=20).returncode == 0
+    except Exception:
+        return False
+
+@lru_cache(maxsize=1)
+def select_video_codec() -> str:
+    """Resolve FFMPEG_VCODEC to an encoder that actually works here, falling back to libx264."""
+    requested = FFMPEG_VCODEC.strip().lower()
+    encoders = available_encoders()
+    if requested == "auto":
+        candidates = [c for c in HW_H264_ENCODERS if c in encoders and c not in _FAILED_CODECS]
+        return next((c for c in candidates if encoder_works(c)), "libx264")
+    if requested != "libx264" and (requested not in encoders or requested in _FAILED_CODECS
+                                   or not encoder_works(requested)):
+        print(f"⚠️ ffmpeg encoder {requested} not usable, falling back to libx264")
+        return "libx264"
+    return requested
+
+def mark_codec_failed(codec: str) -> None:
+    """Stop selecting a hardware encoder that exited with an error."""
+    if codec != "libx264":
+        print(f"⚠️ ffmpeg encoder {codec} failed, using libx264 from now on")
+        _FAILED_CODECS.add(codec)
+        select_video_codec.cache_clear()
+
+def video_encode_args(codec: str | None = None) -> list:
+    """Output-side ffmpeg args for an H.264 encoder (default: the selected one)."""
+    codec = codec or select_video_codec()
+    if codec == "h264_vaapi":
+        # frames are uploaded to the GPU surface; pixel format is set by the filter chain
+        return ["-vaapi_device", FFMPEG_VAAPI_DEVICE, "-vf", "format=nv12,hwupload", "-c:v", codec]
+    args = ["-c:v", codec]
+    preset = FFMPEG_PRESET or DEFAULT_PRESETS.get(codec)
+    if preset and codec in DEFAULT_PRESETS:
+        args += ["-preset", preset]
+    return args + ["-pix_fmt", "yuv420p"]
+
+def _jpeg_stitch_cmd(out_path: Path, fps: float, codec: str) -> list:
+    """ffmpeg command encoding a stream of JPEGs on stdin into an H.264 mp4."""
+    return [
+        FFMPEG_BIN,
+        "-y",
+        "-framerate", str(fps),
+        "-f", "image2pipe",
+        "-c:v", "mjpeg",
+        "-i", "pipe:0",
+        *video_encode_args(codec),
+        str(out_path)
+    ]
 
 def save_upload_to_disk(file_bytes: bytes, filename_hint: str) -> Path:
     suffix = Path(filename_hint).suffix or ".mp4"
@@ -14,48 +117,229 @@ def save_upload_to_disk(file_bytes: bytes, filename_hint: str) -> Path:
         f.write(file_bytes)
     return path
 
+class _FirstFrameCapture:
+    """A capture whose first frame was already read; read() hands that frame out first."""
+
+    def __init__(self, cap, frame):
+        self._cap = cap
+        self._frame = frame
+
+    def read(self):
+        if self._frame is not None:
+            frame, self._frame = self._frame, None
+            return True, frame
+        return self._cap.read()
+
+    def release(self):
+        self._frame = None
+        self._cap.release()
+
+def open_video_capture(path: Path):
+    """
+    Open a video for frame-by-frame decoding, or return None if it can't be opened.
+    Prefers NVDEC (ffmpegcv.VideoCaptureNV) per VIDEO_DECODER when it decodes the first frame,
+    else cv2.VideoCapture.
+    Both expose read() -> (ok, bgr_frame) and release(); only cv2 accepts an output buffer.
+    """
+    if VIDEO_DECODER in ("auto", "nvdec"):
+        try:
+            import ffmpegcv
+            import torch
+            if torch.cuda.is_available():
+                cap = ffmpegcv.VideoCaptureNV(str(path))
+                # the NVDEC pipeline only fails once it decodes (no cuvid decoder for this
+                # codec, driver trouble), so verify with the first frame before committing
+                ok, frame = cap.read()
+                if ok:
+                    return _FirstFrameCapture(cap, frame)
+                cap.release()
+                print(f"⚠️ NVDEC could not decode {path}, using OpenCV decoder.")
+            elif VIDEO_DECODER == "nvdec":
+                print("⚠️ NVDEC requested but CUDA is not available — using OpenCV decoder.")
+        except Exception as e:
+            if VIDEO_DECODER == "nvdec":
+                print(f"⚠️ NVDEC decoder unavailable, using OpenCV: {e}")
+
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        cap.release()
+        return None
+    return cap
+
 def read_video_metadata(path: Path) -> dict:
     cap = cv2.VideoCapture(str(path))
     if not cap.isOpened():
         cap.release()
         raise RuntimeError("Cannot open video for metadata")
-    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    # containers without a duration (e.g. some mkv) report 0 or a negative count
+    total = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0), 0)
     fps = float(cap.get(cv2.CAP_PROP_FPS) or 30.0)
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
     cap.release()
     return {"total_frames": total, "fps": fps, "width": width, "height": height}
 
-def stitch_frames_to_video(frame_paths: list, out_path: Path, fps: float) -> None:
+async def start_h264_encoder(out_path: Path, width: int, height: int, fps: float,
+                             codec: str | None = None) -> asyncio.subprocess.Process:
     """
-    Uses ffmpeg to stitch frames named with increasing indices.
-    frame_paths: list of file paths in correct order.
+    Spawn a long-running ffmpeg that encodes raw BGR frames written to its stdin into an H.264 mp4.
+    Feed frames with write_raw_frame(), then close stdin and await proc.wait() to finalize.
+    codec defaults to select_video_codec().
     """
-    if not frame_paths:
-        raise RuntimeError("No frames to stitch")
-
-    tmp_dir = TMP_DIR / f"ff_{uuid.uuid4().hex}"
-    tmp_dir.mkdir(parents=True, exist_ok=True)
-    # copy frames into tmp_dir with 6-digit ordering
-    for i, src in enumerate(frame_paths):
-        dst = tmp_dir / f"frame_{i:06d}.jpg"
-        with open(src, "rb") as fr, open(dst, "wb") as fw:
-            fw.write(fr.read())
-
-    # build ffmpeg args
-    # -y overwrite, -r fps, -i frame_%06d.jpg
     cmd = [
         FFMPEG_BIN,
         "-y",
-        "-framerate", str(fps),
-        "-i", str(tmp_dir / "frame_%06d.jpg"),
-        "-c:v", "libx264",
-        "-pix_fmt", "yuv420p",
+        "-loglevel", "error",
+        "-f", "rawvideo",
+        "-pix_fmt", "bgr24",
+        "-s", f"{width}x{height}",
+        "-r", str(fps),
+        "-i", "pipe:0",
+        *video_encode_args(codec),
         str(out_path)
     ]
-    import subprocess
-    subprocess.run(cmd, check=True)
-    # cleanup
-    for p in tmp_dir.iterdir():
-        p.unlink()
-    tmp_dir.rmdir()
+    return await asyncio.create_subprocess_exec(*cmd, stdin=asyncio.subprocess.PIPE)
+
+async def write_raw_frame(proc: asyncio.subprocess.Process, frame) -> None:
+    """Write one HxWx3 uint8 frame to an encoder started by start_h264_encoder."""
+    # a flat byte view: the pipe transport measures writes with len(), which for the
+    # frame's own 3-D memoryview would be its row count, not its size in bytes
+    proc.stdin.write(memoryview(np.ascontiguousarray(frame)).cast("B"))
+    await proc.stdin.drain()
+
+class NoFramesCached(RuntimeError):
+    pass
+
+async def stitch_from_redis(job_id: str, out_path: Path, fps: float, page_size: int = STITCH_PAGE_SIZE) -> int:
+    """
+    Encode a job's cached JPEG frames (job:<id>:frames) straight from Redis into an H.264 mp4,
+    reading the list a page at a time so long videos never sit in memory all at once.
+    Returns the number of frames written; raises if none are cached or ffmpeg fails.
+    """
+    from app.utils.redis_client import get_redis
+    redis = get_redis()
+    frames_key = f"job:{job_id}:frames"
+
+    page = await redis.lrange(frames_key, 0, page_size - 1)
+    if not page:
+        raise NoFramesCached(f"No frames cached for job {job_id}")
+
+    while True:
+        codec = select_video_codec()
+        proc = await asyncio.create_subprocess_exec(
+            *_jpeg_stitch_cmd(out_path, fps, codec), stdin=asyncio.subprocess.PIPE
+        )
+        written = 0
+        try:
+            while page:
+                for jpg in page:
+                    proc.stdin.write(jpg)
+                    await proc.stdin.drain()
+                written += len(page)
+                if len(page) < page_size:
+                    break
+                page = await redis.lrange(frames_key, written, written + page_size - 1)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # ffmpeg exited early; its exit code says why
+        finally:
+            proc.stdin.close()
+            returncode = await proc.wait()
+        if returncode == 0:
+            return written
+        if codec == "libx264":
+            raise RuntimeError(f"ffmpeg failed with exit code {returncode}")
+        # hardware encoder failed at runtime: retry the whole video with libx264
+        mark_codec_failed(codec)
+        page = await redis.lrange(frames_key, 0, page_size - 1)
+
+def stitch_frames_to_video(frame_paths: list, out_path: Path, fps: float) -> None:
+    """
+    Uses ffmpeg to stitch JPEG frames into an H.264 mp4.
+    frame_paths: list of file paths in correct order; they are streamed to ffmpeg's stdin.
+    """
+    if not frame_paths:
+        raise RuntimeError("No frames to stitch")
+
+    while True:
+        codec = select_video_codec()
+        cmd = _jpeg_stitch_cmd(out_path, fps, codec)
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        try:
+            for src in frame_paths:
+                with open(src, "rb") as f:
+                    proc.stdin.write(f.read())
+        except BrokenPipeError:
+            pass  # ffmpeg exited early; its exit code says why
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            returncode = proc.wait()
+        if returncode == 0:
+            return
+        if codec == "libx264":
+            raise subprocess.CalledProcessError(returncode, cmd)
+        mark_codec_failed(codec)
+
+class _ChunkSink:
+    """Write-only file object for PyAV: no seek(), so the muxer streams its output in order."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class LiveH264Stream:
+    """
+    Incremental H.264 encode of BGR frames into fragmented MP4, playable in the browser
+    through Media Source Extensions. init_segment (ftyp + moov) must reach a viewer before
+    any media bytes; encode()/close() return the bytes the muxer produced since the last call.
+    Calls must be made one at a time (the encoder is stateful).
+    """
+
+    def __init__(self, width: int, height: int, fps: float):
+        if av is None:
+            raise RuntimeError("PyAV is not installed")
+        self.width, self.height = width, height
+        self._sink = _ChunkSink()
+        # one fragment per frame and a flush per packet keep latency at about one frame
+        self._container = av.open(
+            self._sink, "w", format="mp4",
+            options={"movflags": "empty_moov+default_base_moof+frag_every_frame", "flush_packets": "1"},
+        )
+        stream = self._container.add_stream("libx264", rate=Fraction(fps).limit_denominator(1001))
+        stream.width, stream.height, stream.pix_fmt = width, height, "yuv420p"
+        # keyframe every second so viewers that join mid-job can start decoding
+        stream.options = {
+            "preset": "ultrafast", "tune": "zerolatency", "profile": "baseline",
+            "g": str(max(1, round(fps))),
+        }
+        self._stream = stream
+        self._pts = 0
+        self._container.start_encoding()
+        self.init_segment = self._sink.take()
+
+    def encode(self, frame) -> bytes:
+        if frame.shape[1] != self.width or frame.shape[0] != self.height:
+            frame = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        vf = av.VideoFrame.from_ndarray(frame, format="bgr24")
+        vf.pts = self._pts
+        self._pts += 1
+        for packet in self._stream.encode(vf):
+            self._container.mux(packet)
+        return self._sink.take()
+
+    def close(self) -> bytes:
+        for packet in self._stream.encode():
+            self._container.mux(packet)
+        self._container.close()
+        return self._sink.take()
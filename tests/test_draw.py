@@ -0,0 +1,23 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.models.draw import draw_boxes
+
+
+@pytest.mark.parametrize("thickness", [1, 2, 3, 5])
+def test_draw_boxes_matches_cv2_rectangle(thickness):
+    rng = np.random.default_rng(thickness)
+    # corners partly off-image on every side, plus degenerate boxes
+    xy1 = rng.integers(-20, 100, size=(200, 2))
+    xy2 = xy1 + rng.integers(0, 50, size=(200, 2))
+    xyxy = np.hstack([xy1, xy2]).astype(np.int32)
+    colors = rng.integers(0, 256, size=(200, 3)).astype(np.uint8)
+
+    expected = np.zeros((90, 120, 3), np.uint8)
+    got = expected.copy()
+    for (x1, y1, x2, y2), color in zip(xyxy.tolist(), colors.tolist()):
+        cv2.rectangle(expected, (x1, y1), (x2, y2), color, thickness)
+    draw_boxes(got, xyxy, colors, thickness)
+
+    np.testing.assert_array_equal(got, expected)
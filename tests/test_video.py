@@ -0,0 +1,135 @@
+import asyncio
+import shutil
+
+import numpy as np
+import pytest
+
+from app.utils import video
+
+
+def _pipe_frames(out_path, frames, fps=25.0):
+    async def run():
+        h, w = frames[0].shape[:2]
+        proc = await video.start_h264_encoder(out_path, w, h, fps)
+        for frame in frames:
+            await video.write_raw_frame(proc, frame)
+        proc.stdin.close()
+        return await proc.wait()
+    return asyncio.run(run())
+
+
+def test_write_raw_frame_delivers_every_byte(tmp_path, monkeypatch):
+    # stand-in for ffmpeg: copy stdin to the last argument (the output path)
+    fake = tmp_path / "ffmpeg"
+    fake.write_text('#!/bin/sh\nfor a; do out=$a; done\ncat > "$out"\n')
+    fake.chmod(0o755)
+    monkeypatch.setattr(video, "FFMPEG_BIN", str(fake))
+    monkeypatch.setattr(video, "video_encode_args", lambda codec=None: [])
+
+    # larger than a pipe buffer, so the transport has to buffer partial writes
+    frames = [np.full((1080, 1920, 3), i, np.uint8) for i in range(3)]
+    out = tmp_path / "raw.bin"
+    assert _pipe_frames(out, frames) == 0
+    assert out.read_bytes() == b"".join(f.tobytes() for f in frames)
+
+
+# stand-in for a distro ffmpeg built with NVENC on a host without an NVIDIA GPU:
+# h264_nvenc is listed by -encoders but every encode with it fails
+FAKE_NVENC_FFMPEG = """#!/bin/sh
+case "$*" in
+  *-encoders*) echo " V....D h264_nvenc  NVIDIA NVENC H.264 encoder"; echo " V....D libx264  libx264 H.264"; exit 0;;
+  *h264_nvenc*) exit 1;;
+esac
+for a; do out=$a; done
+[ "$out" = "-" ] && exit 0
+cat > "$out"
+"""
+
+
+@pytest.fixture
+def fake_nvenc_ffmpeg(tmp_path, monkeypatch):
+    fake = tmp_path / "ffmpeg"
+    fake.write_text(FAKE_NVENC_FFMPEG)
+    fake.chmod(0o755)
+    monkeypatch.setattr(video, "FFMPEG_BIN", str(fake))
+    monkeypatch.setattr(video, "_FAILED_CODECS", set())
+    cached = (video.available_encoders, video.encoder_works, video.select_video_codec)
+    for fn in cached:
+        fn.cache_clear()
+    yield
+    for fn in cached:
+        fn.cache_clear()
+
+
+def test_auto_codec_skips_listed_but_unusable_encoder(fake_nvenc_ffmpeg, monkeypatch):
+    monkeypatch.setattr(video, "FFMPEG_VCODEC", "auto")
+    assert "h264_nvenc" in video.available_encoders()
+    assert video.select_video_codec() == "libx264"
+
+
+def test_stitch_retries_with_libx264_after_hw_encoder_failure(fake_nvenc_ffmpeg, tmp_path, monkeypatch):
+    # the trial encode passed, but the encoder fails on the real job
+    monkeypatch.setattr(video, "FFMPEG_VCODEC", "h264_nvenc")
+    monkeypatch.setattr(video, "encoder_works", lambda codec: True)
+    frames = []
+    for i in range(3):
+        p = tmp_path / f"{i}.jpg"
+        p.write_bytes(b"jpg%d" % i)
+        frames.append(p)
+    out = tmp_path / "out.mp4"
+    video.stitch_frames_to_video(frames, out, 25.0)
+    assert out.read_bytes() == b"jpg0jpg1jpg2"
+    assert video.select_video_codec() == "libx264"
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_start_h264_encoder_encodes_all_frames(tmp_path):
+    import cv2
+
+    frames = [np.random.default_rng(i).integers(0, 256, (240, 320, 3), dtype=np.uint8) for i in range(10)]
+    out = tmp_path / "out.mp4"
+    assert _pipe_frames(out, frames) == 0
+    cap = cv2.VideoCapture(str(out))
+    assert int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) == len(frames)
+    cap.release()
+
+
+@pytest.mark.parametrize("nvdec_decodes", [True, False])
+def test_open_video_capture_verifies_nvdec_first_frame(tmp_path, monkeypatch, nvdec_decodes):
+    import sys
+    import types
+
+    import cv2
+
+    path = tmp_path / "clip.avi"
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+    for i in range(3):
+        writer.write(np.full((48, 64, 3), 40 * i, np.uint8))
+    writer.release()
+
+    class FakeNV:
+        def __init__(self, _path):
+            self.count = 0
+
+        def read(self):
+            if not nvdec_decodes:
+                return False, None
+            self.count += 1
+            return True, np.full((48, 64, 3), self.count, np.uint8)
+
+        def release(self):
+            pass
+
+    monkeypatch.setitem(sys.modules, "ffmpegcv", types.SimpleNamespace(VideoCaptureNV=FakeNV))
+    monkeypatch.setitem(sys.modules, "torch", types.SimpleNamespace(cuda=types.SimpleNamespace(is_available=lambda: True)))
+    monkeypatch.setattr(video, "VIDEO_DECODER", "auto")
+
+    cap = video.open_video_capture(path)
+    ok, frame = cap.read()
+    assert ok
+    if nvdec_decodes:
+        # the probe frame is not lost
+        assert frame[0, 0, 0] == 1 and cap.read()[1][0, 0, 0] == 2
+    else:
+        assert isinstance(cap, cv2.VideoCapture)
+    cap.release()